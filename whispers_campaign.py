@@ -1,11 +1,31 @@
 import streamlit as st
-import json
+import streamlit.components.v1 as components
 import uuid
 import os
-from datetime import datetime
+import time
+import tempfile
+import bisect
+import threading
+from datetime import datetime, timezone
 from urllib.parse import urlencode, urlparse, urlunparse, parse_qs
 import networkx as nx
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib codec
+    orjson = None
+    import json
+
+try:
+    import igraph as ig
+except ImportError:  # optional: large trees fall back to networkx's layout
+    ig = None
+
+try:
+    from pyvis.network import Network
+except ImportError:  # optional: without pyvis the tree is drawn with matplotlib
+    Network = None
 
 # -------------------------
 # Config
@@ -15,32 +35,161 @@ st.set_page_config(page_title="Whisper Remix Hub", page_icon="🧵", layout="wid
 # Set your deployment base URL here once you host it online (e.g., https://yourapp.streamlit.app).
 # For local prototyping, this will default to localhost and the current port, which may vary.
 DEFAULT_BASE_URL = "http://localhost:8501"
-BASE_URL = st.sidebar.text_input("Base URL (used to generate share links)", DEFAULT_BASE_URL)
+# In a form, the share links (and their caches) only change when the URL is applied.
+with st.sidebar.form("base_url_form"):
+    BASE_URL = st.text_input("Base URL (used to generate share links)", DEFAULT_BASE_URL)
+    st.form_submit_button("Apply")
 
-DATA_FILE = "whispers.json"
+DATA_FILE = "whispers.json"   # compacted snapshot
+LOG_FILE = "whispers.jsonl"   # one record per line, appended since the last compaction
+COMPACTING_FILE = LOG_FILE + ".compacting"  # the log, moved aside while it is folded in
+COMPACT_AFTER = 500           # fold the log into the snapshot once it has this many records
 
 # -------------------------
 # Data helpers
 # -------------------------
-def load_whispers():
+def _load_snapshot():
     if not os.path.exists(DATA_FILE):
         return {}
     try:
+        if orjson is not None:
+            with open(DATA_FILE, "rb") as f:
+                return orjson.loads(f.read())
         with open(DATA_FILE, "r", encoding="utf-8") as f:
             return json.load(f)
     except Exception:
+        # Keep the unreadable snapshot: returning {} alone would let the next save overwrite it.
+        backup = f"{DATA_FILE}.corrupt-{int(time.time())}"
+        os.replace(DATA_FILE, backup)
+        st.error(f"{DATA_FILE} could not be read; it was moved to {backup} so it can be recovered.")
         return {}
 
+def _apply_record(data, rec):
+    # A record is a full whisper; its parent link is rebuilt from rec["parent"].
+    rec.setdefault("children", [])
+    data[rec["id"]] = rec
+    parent = data.get(rec.get("parent"))
+    if parent is not None and rec["id"] not in parent.setdefault("children", []):
+        parent["children"].append(rec["id"])
+
+def _replay_log(data, path):
+    replayed = 0
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return 0  # no log (or no compaction in progress) is an empty log
+    with f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                rec = orjson.loads(line) if orjson is not None else json.loads(line)
+            except ValueError:
+                continue  # torn last line from an interrupted append
+            _apply_record(data, rec)
+            replayed += 1
+    return replayed
+
+@st.cache_resource
+def _data_lock():
+    # One lock per server process: sessions read the snapshot + logs and compact one at a time,
+    # so nobody replays a file that another session's compaction is moving or deleting.
+    return threading.Lock()
+
+def load_whispers():
+    with _data_lock():
+        data = _load_snapshot()
+        replayed = 0
+        # a compaction that was interrupted leaves its log aside; replay it before the live log
+        for path in (COMPACTING_FILE, LOG_FILE):
+            replayed += _replay_log(data, path)
+        if replayed >= COMPACT_AFTER:
+            compact_whispers(data)
+    # backfill the integer sort key for records written before it existed
+    for w in data.values():
+        if "ts" not in w:
+            try:
+                w["ts"] = iso_to_ts(w["timestamp"])
+            except (KeyError, TypeError, ValueError):
+                w["ts"] = 0
+    return data
+
+def data_mtime():
+    return tuple(os.path.getmtime(p) if os.path.exists(p) else 0 for p in (DATA_FILE, LOG_FILE))
+
+def append_whisper(rec):
+    # O(record) per write instead of rewriting the whole corpus.
+    line = orjson.dumps(rec) if orjson is not None else json.dumps(rec, ensure_ascii=False).encode("utf-8")
+    seen = st.session_state.get("_whispers_mtime") == data_mtime()
+    with open(LOG_FILE, "ab") as f:
+        f.write(line + b"\n")
+    # Only claim the new mtime if this session was current before the write; if another
+    # session appended meanwhile, keep the stale stamp so the next rerun reloads.
+    if seen:
+        st.session_state["_whispers_mtime"] = data_mtime()
+
+def compact_whispers(data):
+    # Caller holds _data_lock(). Move the log aside before folding it in: appends from other sessions then start a
+    # fresh log instead of landing in a file that is about to be deleted.
+    if not os.path.exists(COMPACTING_FILE):
+        try:
+            os.replace(LOG_FILE, COMPACTING_FILE)
+        except OSError:
+            return  # log gone or held open elsewhere; compact on a later load
+    # pick up whatever was appended between the replay and the move
+    _replay_log(data, COMPACTING_FILE)
+    save_whispers(data)
+    os.remove(COMPACTING_FILE)
+
 def save_whispers(data):
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    if orjson is not None:
+        payload = orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    else:
+        payload = json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+    # Write a temp file and swap it in, so a crash mid-write never truncates the corpus.
+    # The temp name is unique per call, so concurrent saves can't interleave into one file.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(DATA_FILE) or ".", prefix=os.path.basename(DATA_FILE) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, DATA_FILE)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def _ts_key(w):
+    return w["ts"]
+
+def build_indexes(data):
+    # Single pass over a timestamp-sorted view; both lists are oldest -> newest.
+    roots, remixes = [], []
+    for w in sorted(data.values(), key=_ts_key):
+        (roots if w["parent"] is None else remixes).append(w)
+    return roots, remixes
+
+def index_whisper(w):
+    # Keep the cached roots/remixes lists sorted as new whispers arrive.
+    key = "roots_by_ts" if w["parent"] is None else "remixes_by_ts"
+    bisect.insort(st.session_state[key], w, key=_ts_key)
 
 def new_id():
-    return str(uuid.uuid4())
+    return uuid.uuid4().hex
 
 def now_iso():
     return datetime.utcnow().isoformat() + "Z"
 
+def iso_to_ts(iso):
+    # integer sort key (microseconds since epoch) for a now_iso() string
+    dt = datetime.fromisoformat(iso.rstrip("Z")).replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1_000_000)
+
+def now_stamp():
+    iso = now_iso()
+    return {"timestamp": iso, "ts": iso_to_ts(iso)}
+
 def build_whisper_message(motif, phrase):
     motif = (motif or "").strip()
     phrase = (phrase or "").strip()
@@ -51,12 +200,14 @@ def build_whisper_message(motif, phrase):
     else:
         return phrase
 
+def _link_prefix(base_url):
+    # scheme://netloc/path of the base URL
+    parsed = urlparse(base_url)
+    return urlunparse((parsed.scheme, parsed.netloc, parsed.path or "/", "", "", ""))
+
 def make_link_for_id(base_url, wid):
     # Build a URL with ?id=<wid> and view=detail for deep links
-    parsed = urlparse(base_url)
-    query = {"id": wid, "view": "detail"}
-    new_query = urlencode(query)
-    return urlunparse((parsed.scheme, parsed.netloc, parsed.path or "/", "", new_query, ""))
+    return f"{_link_prefix(base_url)}?{urlencode({'id': wid, 'view': 'detail'})}"
 
 def make_snippet(message, wid, base_url):
     link = make_link_for_id(base_url, wid)
@@ -65,14 +216,27 @@ def make_snippet(message, wid, base_url):
 # -------------------------
 # Load data
 # -------------------------
-whispers = load_whispers()
+# Streamlit reruns the whole script per interaction; only re-read the files when they changed.
+if st.session_state.get("_whispers_mtime") != data_mtime() or "whispers" not in st.session_state:
+    mtime = data_mtime()  # stamped before reading, so a write during the load still triggers a reload
+    st.session_state["whispers"] = load_whispers()
+    st.session_state["_whispers_mtime"] = mtime
+    st.session_state["roots_by_ts"], st.session_state["remixes_by_ts"] = build_indexes(st.session_state["whispers"])
+whispers = st.session_state["whispers"]
+roots_by_ts = st.session_state["roots_by_ts"]
+remixes_by_ts = st.session_state["remixes_by_ts"]
 
 # -------------------------
 # URL routing via query params
 # -------------------------
-params = st.experimental_get_query_params()
-current_view = params.get("view", ["home"])[0]
-current_id = params.get("id", [None])[0]
+current_view = st.query_params.get("view", "home")
+current_id = st.query_params.get("id")
+
+def navigate(view):
+    # only touch the URL (and rerun into the new view) when the view actually changes
+    if current_view != view:
+        st.query_params.from_dict({"view": view})
+        st.rerun()
 
 # -------------------------
 # UI: Header
@@ -85,11 +249,11 @@ st.caption("Create immutable whisper anchors, remix by extending, and track line
 # -------------------------
 st.sidebar.markdown("### Navigation")
 if st.sidebar.button("Home"):
-    st.experimental_set_query_params(view="home")
+    navigate("home")
 if st.sidebar.button("All whispers"):
-    st.experimental_set_query_params(view="browse")
+    navigate("browse")
 if st.sidebar.button("Tree view"):
-    st.experimental_set_query_params(view="tree")
+    navigate("tree")
 
 # -------------------------
 # Create Whisper
@@ -119,18 +283,21 @@ if create_btn:
             "parent": None,
             "children": [],
             "author": author.strip() if author else None,
-            "timestamp": now_iso(),
+            **now_stamp(),
         }
-        save_whispers(whispers)
+        index_whisper(whispers[wid])
+        append_whisper(whispers[wid])
         st.success("Whisper created.")
         # Jump to its detail page
-        st.experimental_set_query_params(view="detail", id=wid)
+        st.query_params.from_dict({"view": "detail", "id": wid})
 
 st.markdown("---")
 
 # -------------------------
 # Detail / Remix view
 # -------------------------
+# Views are fragments: their own widget events rerun only the view, not the whole script.
+@st.fragment
 def render_detail(wid):
     if wid not in whispers:
         st.error("Whisper not found.")
@@ -173,14 +340,16 @@ def render_detail(wid):
                 "parent": wid,
                 "children": [],
                 "author": (remix_author or "").strip() or None,
-                "timestamp": now_iso(),
+                **now_stamp(),
             }
             # Link child immutably
             whispers[wid]["children"].append(new_wid)
-            save_whispers(whispers)
-            st.success("Remix created.")
-            # Jump to new remix detail
-            st.experimental_set_query_params(view="detail", id=new_wid)
+            index_whisper(whispers[new_wid])
+            append_whisper(whispers[new_wid])
+            st.toast("Remix created.")
+            # Jump to new remix detail; a full rerun so the router leaves this fragment
+            st.query_params.from_dict({"view": "detail", "id": new_wid})
+            st.rerun()
 
     st.markdown("#### Children (remixes)")
     kids = w.get("children", [])
@@ -198,37 +367,94 @@ def render_detail(wid):
 # -------------------------
 # Browse all whispers
 # -------------------------
+def render_whisper_picker(items, key, label="Select whisper", button_label="Open"):
+    # One selectbox + one button, instead of a "View" button per whisper.
+    options = {f"{w['message'][:60]} — {w['id'][:8]}": w["id"] for w in items}
+    if not options:
+        return
+    choice = st.selectbox(label, list(options.keys()), key=f"{key}_select")
+    if st.button(button_label, key=f"{key}_open"):
+        st.query_params.from_dict({"view": "detail", "id": options[choice]})
+        st.rerun()
+
+@st.fragment
 def render_browse():
     st.markdown("### All whispers")
     if not whispers:
         st.info("No whispers yet. Create one above.")
         return
-    # Root-first, then remixes
-    roots = [w for w in whispers.values() if w["parent"] is None]
-    remixes = [w for w in whispers.values() if w["parent"] is not None]
-
+    # Root-first, then remixes (newest first)
     st.markdown("#### Roots")
-    for w in sorted(roots, key=lambda x: x["timestamp"], reverse=True):
+    for w in reversed(roots_by_ts):
         link = make_link_for_id(BASE_URL, w["id"])
         st.markdown(f"- **{w['message']}**")
         st.caption(f"By {w.get('author') or 'Anonymous'} • {w.get('timestamp')} • Link: {link}")
-        # Quick button to jump to detail
-        if st.button(f"View → {w['id']}", key=f"view_{w['id']}"):
-            st.experimental_set_query_params(view="detail", id=w["id"])
 
     st.markdown("#### Remixes")
-    for w in sorted(remixes, key=lambda x: x["timestamp"], reverse=True):
+    for w in reversed(remixes_by_ts):
         link = make_link_for_id(BASE_URL, w["id"])
         parent = whispers.get(w["parent"])
         parent_msg = parent["message"] if parent else "(unknown)"
         st.markdown(f"- **{w['message']}**")
         st.caption(f"By {w.get('author') or 'Anonymous'} • {w.get('timestamp')} • Parent: {parent_msg} • Link: {link}")
-        if st.button(f"View → {w['id']}", key=f"view_{w['id']}"):
-            st.experimental_set_query_params(view="detail", id=w["id"])
+
+    # Quick jump to detail
+    st.markdown("#### Open a whisper")
+    render_whisper_picker(list(reversed(roots_by_ts)) + list(reversed(remixes_by_ts)), key="browse", label="Browse whispers")
 
 # -------------------------
 # Tree visualization
 # -------------------------
+FAST_LAYOUT_THRESHOLD = 200
+
+def fast_layout(G):
+    # igraph's C Fruchterman-Reingold; positions are keyed back to the networkx node ids.
+    id2idx = {node: i for i, node in enumerate(G.nodes)}
+    ig_g = ig.Graph(n=len(G), edges=[(id2idx[u], id2idx[v]) for u, v in G.edges], directed=True)
+    coords = ig_g.layout_fruchterman_reingold(niter=200)
+    return {node: tuple(coords[i]) for node, i in id2idx.items()}
+
+def tree_figure():
+    # One Figure per session, cleared between renders. A bare Figure isn't held by
+    # pyplot's global registry, so it goes away with the session instead of per-rerun leaks.
+    fig = st.session_state.get("_tree_fig")
+    if fig is None:
+        fig = Figure(figsize=(10, 6))
+        st.session_state["_tree_fig"] = fig
+    fig.clear()
+    return fig, fig.add_subplot()
+
+@st.cache_data(show_spinner=False)
+def compute_layout(nodes, edges):
+    # Spring layout is the expensive part of the tree view; only recompute when the topology changes.
+    G = nx.DiGraph()
+    G.add_nodes_from(nodes)
+    G.add_edges_from(edges)
+    if ig is not None and len(G) > FAST_LAYOUT_THRESHOLD:
+        return fast_layout(G)
+    return nx.spring_layout(G, seed=42, k=1.2)
+
+def screen_positions(pos):
+    # Layout coordinates scaled into roughly 1000x600px, y flipped for screen coordinates.
+    xs = [p[0] for p in pos.values()]
+    ys = [p[1] for p in pos.values()]
+    sx = 1000 / ((max(xs) - min(xs)) or 1)
+    sy = 600 / ((max(ys) - min(ys)) or 1)
+    return {n: (float(x * sx), float(-y * sy)) for n, (x, y) in pos.items()}
+
+@st.cache_data(show_spinner=False)
+def build_tree_html(nodes, edges):
+    # Interactive vis.js canvas pinned to the cached layout: with physics off the browser
+    # paints at once instead of simulating forces. nodes: ((id, label, x, y), ...)
+    net = Network(height="600px", width="100%", directed=True)
+    for wid, label, x, y in nodes:
+        net.add_node(wid, label=label, title=label, x=x, y=y)
+    for parent, child in edges:
+        net.add_edge(parent, child)
+    net.toggle_physics(False)
+    return net.generate_html()
+
+@st.fragment
 def render_tree():
     st.markdown("### Whisper lineage tree")
     if not whispers:
@@ -236,28 +462,31 @@ def render_tree():
         return
 
     # Build graph
-    G = nx.DiGraph()
+    nodes, edges = [], []
     for w in whispers.values():
-        label = w["message"]
-        G.add_node(w["id"], label=label)
+        label = w["message"][:50] + ("…" if len(w["message"]) > 50 else "")
+        nodes.append((w["id"], {"label": label}))
         if w["parent"]:
-            G.add_edge(w["parent"], w["id"])
+            edges.append((w["parent"], w["id"]))
+    G = nx.DiGraph()
+    G.add_nodes_from(nodes)
+    G.add_edges_from(edges)
 
-    # Draw
-    fig, ax = plt.subplots(figsize=(10, 6))
-    pos = nx.spring_layout(G, seed=42, k=1.2)
-    nx.draw(G, pos, ax=ax, with_labels=False, node_size=600, node_color="#91c9ff", arrows=True, arrowstyle="-|>", arrowsize=12)
-    labels = {n: G.nodes[n]["label"][:50] + ("…" if len(G.nodes[n]["label"]) > 50 else "") for n in G.nodes}
-    nx.draw_networkx_labels(G, pos, labels=labels, font_size=8)
-    st.pyplot(fig)
+    # Draw; a parent missing from the corpus is added by networkx without a label
+    labels = {n: G.nodes[n].get("label", "") for n in G.nodes}
+    pos = compute_layout(tuple(G.nodes), tuple(G.edges))
+    if Network is not None:
+        xy = screen_positions(pos)
+        components.html(build_tree_html(tuple((n, labels[n], *xy[n]) for n in G.nodes), tuple(G.edges)), height=650)
+    else:
+        fig, ax = tree_figure()
+        nx.draw(G, pos, ax=ax, with_labels=False, node_size=600, node_color="#91c9ff", arrows=True, arrowstyle="-|>", arrowsize=12)
+        nx.draw_networkx_labels(G, pos, labels=labels, font_size=8)
+        st.pyplot(fig)
 
     # Select a node to view
     st.markdown("#### Jump to a whisper")
-    options = {w["message"][:80]: w["id"] for w in whispers.values()}
-    if options:
-        choice = st.selectbox("Select whisper", list(options.keys()))
-        if st.button("View selected"):
-            st.experimental_set_query_params(view="detail", id=options[choice])
+    render_whisper_picker(whispers.values(), key="tree", button_label="View selected")
 
 # -------------------------
 # Router
@@ -278,13 +507,12 @@ else:
         "- **Copy-ready snippets**: post back to social platforms to spread."
     )
     st.markdown("### Recent roots")
-    roots = [w for w in whispers.values() if w["parent"] is None]
-    if not roots:
+    if not roots_by_ts:
         st.info("No root whispers yet. Create one above.")
     else:
-        for w in sorted(roots, key=lambda x: x["timestamp"], reverse=True)[:10]:
+        recent = roots_by_ts[-10:][::-1]
+        for w in recent:
             link = make_link_for_id(BASE_URL, w["id"])
             st.markdown(f"- **{w['message']}**")
             st.caption(f"By {w.get('author') or 'Anonymous'} • {w.get('timestamp')} • Link: {link}")
-            if st.button(f"View → {w['id']}", key=f"home_view_{w['id']}"):
-                st.experimental_set_query_params(view="detail", id=w["id"])
\ No newline at end of file
+        render_whisper_picker(recent, key="home")
\ No newline at end of file
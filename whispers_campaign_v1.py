@@ -1,5 +1,7 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import uuid
+import heapq
 from datetime import datetime
 from urllib.parse import urlencode, urlparse, urlunparse
 import os
@@ -7,7 +9,17 @@ import traceback
 
 # optional graphing
 import networkx as nx
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+
+try:
+    import igraph as ig  # faster layout for large trees
+except ImportError:
+    ig = None
+
+try:
+    from pyvis.network import Network  # browser-side tree canvas
+except ImportError:
+    Network = None
 
 # Firebase
 import firebase_admin
@@ -19,14 +31,20 @@ from firebase_admin import credentials, firestore
 st.set_page_config(page_title="Whisper Remix Hub", page_icon="🧵", layout="wide")
 
 DEFAULT_BASE_URL = "https://whispersbetav2.streamlit.app/"  # replace with your deployed URL
-BASE_URL = st.sidebar.text_input("Base URL", DEFAULT_BASE_URL)
+# In a form, the share links (and their caches) only change when the URL is applied.
+with st.sidebar.form("base_url_form"):
+    BASE_URL = st.text_input("Base URL", DEFAULT_BASE_URL)
+    st.form_submit_button("Apply")
 
 # -------------------------
 # Firebase init with graceful fallback
 # -------------------------
 firestore_available = False
 
-try:
+
+@st.cache_resource(show_spinner=False)
+def get_db():
+    # one client (and gRPC channel) per process, shared by every rerun and session
     if not firebase_admin._apps:
         # prefer service account file if present
         if os.path.exists("firebase-key.json"):
@@ -35,15 +53,24 @@ try:
         else:
             # attempt to initialize with Application Default Credentials
             firebase_admin.initialize_app()
+    return firestore.client()
+
 
-    db = firestore.client()
-    # quick test read to confirm connectivity (non-expensive)
-    _ = list(db.collection("_meta_test").limit(1).stream())
-    firestore_available = True
+try:
+    db = get_db()
+    if "_firestore_ok" not in st.session_state:
+        # quick test read to confirm connectivity; once per session, not on every rerun
+        _ = list(db.collection("_meta_test").limit(1).stream())
+        st.session_state["_firestore_ok"] = True
+    firestore_available = st.session_state["_firestore_ok"]
 except Exception as e:
-    # Log the traceback and show a warning in the app
+    # Log the traceback and remember the failure for the rest of the session
     tb = traceback.format_exc()
-    st.warning("Firestore initialization failed — running in local fallback mode.\n" + str(e))
+    st.session_state["_firestore_ok"] = False
+    st.session_state["_firestore_error"] = str(e)
+
+if not firestore_available:
+    st.warning("Firestore initialization failed — running in local fallback mode.\n" + st.session_state.get("_firestore_error", ""))
     st.info("If you intend to use Firestore, make sure firebase-key.json is present or ADC are configured.")
     # Create local fallback store in session_state
     if "local_whispers" not in st.session_state:
@@ -54,18 +81,20 @@ except Exception as e:
 # -------------------------
 
 def new_id():
-    return str(uuid.uuid4())
+    return uuid.uuid4().hex
 
 
 def now_iso():
     return datetime.utcnow().isoformat() + "Z"
 
 
-def make_link_for_id(base_url, wid):
+def _link_prefix(base_url):
     parsed = urlparse(base_url)
-    query = {"id": wid, "view": "detail"}
-    new_query = urlencode(query)
-    return urlunparse((parsed.scheme, parsed.netloc, parsed.path or "/", "", new_query, ""))
+    return urlunparse((parsed.scheme, parsed.netloc, parsed.path or "/", "", "", ""))
+
+
+def make_link_for_id(base_url, wid):
+    return f"{_link_prefix(base_url)}?{urlencode({'id': wid, 'view': 'detail'})}"
 
 
 def make_snippet(message, wid, base_url):
@@ -91,41 +120,104 @@ def save_whisper(data):
     if firestore_available:
         try:
             db.collection("whispers").document(data["id"]).set(data)
+            _invalidate_reads()
             return
         except Exception:
             _fallback_to_local("save_whisper")
     st.session_state.local_whispers[data["id"]] = data
+    _invalidate_reads()
 
 
 def update_children(parent_id, child_id):
-    parent = get_whisper(parent_id)
+    if firestore_available:
+        try:
+            # server-side append: no read, constant-size payload, idempotent
+            db.collection("whispers").document(parent_id).update({"children": firestore.ArrayUnion([child_id])})
+            _invalidate_reads()
+            return
+        except Exception:
+            _fallback_to_local("update_children")
+    parent = st.session_state.local_whispers.get(parent_id)
     if not parent:
         return
     children = parent.get("children", []) or []
     if child_id not in children:
         children.append(child_id)
     parent["children"] = children
-    # persist updated parent
+    _invalidate_reads()
+
+
+def create_remix(parent_id, remix):
+    """Write the remix and link it to its parent in a single batched commit."""
     if firestore_available:
         try:
-            db.collection("whispers").document(parent_id).update({"children": children})
+            col = db.collection("whispers")
+            batch = db.batch()
+            batch.set(col.document(remix["id"]), remix)
+            batch.update(col.document(parent_id), {"children": firestore.ArrayUnion([remix["id"]])})
+            batch.commit()
+            _invalidate_reads()
             return
         except Exception:
-            _fallback_to_local("update_children")
-    st.session_state.local_whispers[parent_id] = parent
+            _fallback_to_local("create_remix")
+    save_whisper(remix)
+    update_children(parent_id, remix["id"])
+
+
+# fields the list views actually render; detail view still reads full docs
+LIST_FIELDS = ["id", "message", "author", "timestamp", "parent"]
 
 
-def get_all_whispers():
+@st.cache_data(ttl=30, show_spinner=False)
+def _list_whispers_light_cached():
+    docs = db.collection("whispers").select(LIST_FIELDS).stream()
+    return {doc.id: doc.to_dict() for doc in docs}
+
+
+def list_whispers_light():
     if firestore_available:
         try:
-            docs = db.collection("whispers").stream()
-            return {doc.id: doc.to_dict() for doc in docs}
+            return _list_whispers_light_cached()
         except Exception:
-            _fallback_to_local("get_all_whispers")
-    # local fallback
+            _fallback_to_local("list_whispers_light")
     return dict(st.session_state.local_whispers)
 
 
+def _invalidate_reads():
+    # drop cached listings after a write so the next render sees it
+    _list_whispers_light_cached.clear()
+    st.session_state.pop("browse_rows", None)
+
+
+BROWSE_PAGE_SIZE = 50
+
+
+def page_whispers(cursor=None, n=BROWSE_PAGE_SIZE):
+    """Return one page of whispers (newest first) and the cursor for the next page.
+
+    The cursor is the last document snapshot for Firestore, or a list offset for
+    the local fallback; it is None when there are no more pages.
+    """
+    if firestore_available:
+        try:
+            query = (
+                db.collection("whispers")
+                .select(LIST_FIELDS)
+                .order_by("timestamp", direction=firestore.Query.DESCENDING)
+                .limit(n)
+            )
+            if cursor is not None:
+                query = query.start_after(cursor)
+            docs = list(query.stream())
+            return [doc.to_dict() for doc in docs], (docs[-1] if len(docs) == n else None)
+        except Exception:
+            _fallback_to_local("page_whispers")
+    items = sorted(st.session_state.local_whispers.values(), key=lambda x: x.get("timestamp", ""), reverse=True)
+    start = cursor if isinstance(cursor, int) else 0
+    end = start + n
+    return items[start:end], (end if end < len(items) else None)
+
+
 def _fallback_to_local(caller=""):
     """Switch to local fallback and ensure session_state storage exists.
     This is intentionally quiet and idempotent.
@@ -139,20 +231,27 @@ def _fallback_to_local(caller=""):
 # -------------------------
 # Routing
 # -------------------------
-params = st.experimental_get_query_params()
-current_view = params.get("view", ["home"])[0]
-current_id = params.get("id", [None])[0]
+current_view = st.query_params.get("view", "home")
+current_id = st.query_params.get("id")
+
+
+def navigate(view):
+    # only touch the URL (and rerun into the new view) when the view actually changes
+    if current_view != view:
+        st.query_params.from_dict({"view": view})
+        st.rerun()
 
 # -------------------------
 # Sidebar Navigation
 # -------------------------
 st.sidebar.markdown("### Navigation")
 if st.sidebar.button("🏠 Home"):
-    st.experimental_set_query_params(view="home")
+    navigate("home")
 if st.sidebar.button("📜 All Whispers"):
-    st.experimental_set_query_params(view="browse")
+    st.session_state.pop("browse_rows", None)  # start again from the first page
+    navigate("browse")
 if st.sidebar.button("🌳 Tree View"):
-    st.experimental_set_query_params(view="tree")
+    navigate("tree")
 
 # -------------------------
 # Views
@@ -184,16 +283,17 @@ def render_home():
             }
             save_whisper(whisper)
             st.success("Whisper created.")
-            st.experimental_set_query_params(view="detail", id=wid)
+            st.query_params.from_dict({"view": "detail", "id": wid})
 
     st.subheader("Recent whispers")
-    whispers = get_all_whispers()
+    whispers = list_whispers_light()
     roots = [w for w in whispers.values() if w.get("parent") is None]
-    for w in sorted(roots, key=lambda x: x.get("timestamp", ""), reverse=True)[:10]:
+    for w in heapq.nlargest(10, roots, key=lambda x: x.get("timestamp", "")):
         link = make_link_for_id(BASE_URL, w["id"])
         st.markdown(f"- {w['message']} (by {w.get('author') or 'Anonymous'}) → {link}")
 
 
+@st.fragment
 def render_detail(wid):
     w = get_whisper(wid)
     if not w:
@@ -229,10 +329,10 @@ def render_detail(wid):
                 "author": remix_author or None,
                 "timestamp": now_iso(),
             }
-            save_whisper(remix)
-            update_children(wid, new_wid)
-            st.success("Remix created.")
-            st.experimental_set_query_params(view="detail", id=new_wid)
+            create_remix(wid, remix)
+            st.toast("Remix created.")
+            st.query_params.from_dict({"view": "detail", "id": new_wid})
+            st.rerun()  # full app rerun so the router picks up the new id
 
     st.markdown("#### Remixes")
     for cid in w.get("children", []) or []:
@@ -241,34 +341,103 @@ def render_detail(wid):
             st.markdown(f"- {child['message']} (by {child.get('author') or 'Anonymous'})")
 
 
+@st.fragment
 def render_browse():
     st.subheader("All whispers")
-    whispers = get_all_whispers()
-    if not whispers:
+    if "browse_rows" not in st.session_state:
+        st.session_state.browse_rows, st.session_state.browse_cursor = page_whispers()
+    rows = st.session_state.browse_rows
+    if not rows:
         st.info("No whispers yet.")
         return
-    for w in sorted(whispers.values(), key=lambda x: x.get("timestamp", ""), reverse=True):
+    # rows arrive already ordered by timestamp (newest first)
+    for w in rows:
         link = make_link_for_id(BASE_URL, w["id"])
         st.markdown(f"- {w['message']} (by {w.get('author') or 'Anonymous'}) → {link}")
+    if st.session_state.browse_cursor is not None and st.button("Load more"):
+        page, st.session_state.browse_cursor = page_whispers(st.session_state.browse_cursor)
+        rows.extend(page)
+        st.rerun(scope="fragment")
+
+
+FAST_LAYOUT_THRESHOLD = 200
+
+
+def fast_layout(G):
+    # igraph's C implementation of Fruchterman-Reingold, mapped back to node ids
+    id2idx = {node: i for i, node in enumerate(G.nodes)}
+    ig_g = ig.Graph(n=len(G), edges=[(id2idx[u], id2idx[v]) for u, v in G.edges], directed=True)
+    coords = ig_g.layout_fruchterman_reingold(niter=200)
+    return {node: tuple(coords[i]) for node, i in id2idx.items()}
+
+
+def tree_figure():
+    # reused per session and cleared; a bare Figure isn't tracked by pyplot, so nothing leaks per rerun
+    fig = st.session_state.get("_tree_fig")
+    if fig is None:
+        fig = Figure(figsize=(10, 6))
+        st.session_state["_tree_fig"] = fig
+    fig.clear()
+    return fig, fig.add_subplot()
+
+
+@st.cache_data(show_spinner=False)
+def compute_layout(nodes, edges):
+    # spring layout dominates the tree view; cached per topology so reruns skip it
+    G = nx.DiGraph()
+    G.add_nodes_from(nodes)
+    G.add_edges_from(edges)
+    if ig is not None and len(G) > FAST_LAYOUT_THRESHOLD:
+        return fast_layout(G)
+    return nx.spring_layout(G, seed=42)
+
+
+def screen_positions(pos):
+    # layout coordinates scaled into roughly 1000x600px, y flipped for screen coordinates
+    xs = [p[0] for p in pos.values()]
+    ys = [p[1] for p in pos.values()]
+    sx = 1000 / ((max(xs) - min(xs)) or 1)
+    sy = 600 / ((max(ys) - min(ys)) or 1)
+    return {n: (float(x * sx), float(-y * sy)) for n, (x, y) in pos.items()}
+
+
+@st.cache_data(show_spinner=False)
+def build_tree_html(nodes, edges):
+    # vis.js canvas pinned to the cached layout: with physics off the browser
+    # paints at once instead of simulating forces. nodes: ((id, label, x, y), ...)
+    net = Network(height="600px", width="100%", directed=True)
+    for wid, label, x, y in nodes:
+        net.add_node(wid, label=label, title=label, x=x, y=y)
+    for parent, child in edges:
+        net.add_edge(parent, child)
+    net.toggle_physics(False)
+    return net.generate_html()
 
 
 def render_tree():
     st.subheader("Whisper lineage tree")
-    whispers = get_all_whispers()
+    whispers = list_whispers_light()
     if not whispers:
         st.info("No whispers yet.")
         return
-    G = nx.DiGraph()
+    nodes, edges = [], []
     for w in whispers.values():
-        G.add_node(w["id"], label=w.get("message", "(no message)"))
+        # limit label length to avoid overlap
+        nodes.append((w["id"], {"label": (w.get("message") or "(no message)")[:50]}))
         if w.get("parent"):
-            G.add_edge(w["parent"], w["id"])
-    fig, ax = plt.subplots(figsize=(10, 6))
-    pos = nx.spring_layout(G, seed=42)
+            edges.append((w["parent"], w["id"]))
+    G = nx.DiGraph()
+    G.add_nodes_from(nodes)
+    G.add_edges_from(edges)
+    # parents missing from the light read are added by networkx without a label
+    labels = {n: G.nodes[n].get("label", "") for n in G.nodes}
+    pos = compute_layout(tuple(G.nodes), tuple(G.edges))
+    if Network is not None:
+        xy = screen_positions(pos)
+        components.html(build_tree_html(tuple((n, labels[n], *xy[n]) for n in G.nodes), tuple(G.edges)), height=650)
+        return
+    fig, ax = tree_figure()
     nx.draw(G, pos, ax=ax, with_labels=False, node_size=600, node_color="#91c9ff")
-    labels = {n: G.nodes[n].get("label", "")[:50] for n in G.nodes}
-    # limit label length to avoid overlap
-    labels = {n: (labels[n][:50] if labels[n] else "") for n in labels}
     nx.draw_networkx_labels(G, pos, labels=labels, font_size=8)
     st.pyplot(fig)
 
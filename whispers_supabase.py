@@ -1,10 +1,33 @@
 import streamlit as st
+import streamlit.components.v1 as components
+import os
+import time
+import threading
 import uuid
+import statistics
+from collections import deque
 from datetime import datetime, timezone
 from urllib.parse import urlencode, urlparse, urlunparse
-import networkx as nx
-import matplotlib.pyplot as plt
+import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson  # optional: faster codec for Supabase payloads
+except ImportError:
+    orjson = None
+    import json
+
+try:
+    import igraph as ig  # optional C-backed layouts for the tree view
+except ImportError:
+    ig = None
+
+try:
+    from pyvis.network import Network  # optional interactive tree canvas
+except ImportError:
+    Network = None
 
 # =========================================================
 # Streamlit Config
@@ -25,11 +48,35 @@ HEADERS = {
     "apikey": SUPABASE_KEY,
     "Authorization": f"Bearer {SUPABASE_KEY}",
     "Content-Type": "application/json",
-    "Prefer": "return=representation"
 }
 
 TABLE_URL = f"{SUPABASE_URL}/rest/v1/whispers"
 
+# One pooled keep-alive session for every Supabase call, so reruns don't pay a
+# fresh TCP+TLS handshake per request. Inserts are retried too: ids are generated
+# client-side, so a replayed POST can only hit the primary key, never duplicate a row.
+@st.cache_resource
+def _session() -> requests.Session:
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=20,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.25,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=["GET", "POST"],
+            raise_on_status=False,
+        ),
+    )
+    session.mount("https://", adapter)
+    return session
+
+
+SESSION = _session()
+REQUEST_TIMEOUT = (3.05, 10)  # (connect, read) seconds, so a stalled socket cannot hang the rerun
+
 # Your deployed Streamlit URL (anchoring)
 BASE_URL = "https://whispersbetav2.streamlit.app"
 
@@ -38,7 +85,19 @@ BASE_URL = "https://whispersbetav2.streamlit.app"
 # Helpers
 # =========================================================
 def new_id():
-    return str(uuid.uuid4())
+    """
+    UUIDv7 (RFC 9562): a 48-bit millisecond timestamp followed by random bits,
+    so ids sort by creation time and inserts land at the right-hand edge of
+    the primary-key index instead of splitting pages at random.
+    """
+    ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), "big")
+    value = (ms & 0xFFFF_FFFF_FFFF) << 80
+    value |= 0x7 << 76                     # version
+    value |= (rand >> 68) << 64            # rand_a, 12 bits
+    value |= 0b10 << 62                    # RFC variant
+    value |= rand & 0x3FFF_FFFF_FFFF_FFFF  # rand_b, 62 bits
+    return str(uuid.UUID(int=value))
 
 
 def now_iso():
@@ -56,11 +115,14 @@ def build_whisper_message(parent_message, new_phrase):
         return new_phrase
 
 
-def make_link_for_id(base_url, wid):
+def _link_prefix(base_url):
+    # scheme://netloc/path of the base URL
     parsed = urlparse(base_url)
-    query = {"id": wid, "view": "detail"}
-    new_query = urlencode(query)
-    return urlunparse((parsed.scheme, parsed.netloc, parsed.path or "/", "", new_query, ""))
+    return urlunparse((parsed.scheme, parsed.netloc, parsed.path or "/", "", "", ""))
+
+
+def make_link_for_id(base_url, wid):
+    return f"{_link_prefix(base_url)}?{urlencode({'id': wid, 'view': 'detail'})}"
 
 
 def make_snippet(message, wid, motif, base_url=BASE_URL):
@@ -84,78 +146,342 @@ def make_snippet(message, wid, motif, base_url=BASE_URL):
 # =========================================================
 # Supabase CRUD
 # =========================================================
+def _dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data).encode("utf-8")
+
+
+def _loads(r):
+    if orjson is not None:
+        return orjson.loads(r.content)
+    return r.json()
+
+
 def supabase_create_whisper(data):
-    r = requests.post(TABLE_URL, headers=HEADERS, json=data)
+    # ids are generated client-side, so PostgREST needn't echo the row back
     try:
-        resp_json = r.json()
-    except Exception:
-        st.error(f"Supabase create error (non-JSON response): {r.text}")
+        r = SESSION.post(TABLE_URL, data=_dumps(data), headers={"Prefer": "return=minimal"}, timeout=REQUEST_TIMEOUT)
+    except requests.RequestException as e:
+        st.error(f"Supabase create error: {e}")
         return None
-    if r.status_code >= 300:
-        st.error(f"Supabase create error: {resp_json}")
+    if r.status_code >= 300 and not _is_own_id_conflict(r):
+        try:
+            st.error(f"Supabase create error: {_loads(r)}")
+        except Exception:
+            st.error(f"Supabase create error (non-JSON response): {r.text}")
         return None
-    if isinstance(resp_json, list) and resp_json:
-        return resp_json[0]
-    return resp_json
+    _invalidate_reads()
+    return data
 
 
-def supabase_update_children(parent_id, child_id):
-    parent = supabase_get_by_id(parent_id)
-    if not parent:
-        st.error("Parent not found for updating children.")
-        return
-    children = parent.get("children") or []
-    if child_id not in children:
-        children.append(child_id)
-    r = requests.patch(
-        f"{TABLE_URL}?id=eq.{parent_id}",
-        headers=HEADERS,
-        json={"children": children}
-    )
-    if r.status_code >= 300:
-        st.error(f"Supabase update children error: {r.text}")
+def _is_own_id_conflict(r):
+    # A primary-key clash on our client-side id means an earlier (retried) attempt
+    # landed and only its response was lost. Any other 409 -- a missing parent
+    # (23503) or another unique constraint -- is a real failure.
+    if r.status_code != 409:
+        return False
+    try:
+        err = _loads(r)
+    except Exception:
+        return False
+    if not isinstance(err, dict):
+        return False
+    return err.get("code") == "23505" and "whispers_pkey" in (err.get("message") or "")
+
+
+def _invalidate_reads():
+    # writes drop the cached reads so the next rerun sees them
+    _fetch_page.clear()
+    _fetch_by_id.clear()
+    _fetch_with_remixes.clear()
+    _fetch_edges.clear()
+    _fetch_lineage.clear()
+    _landing_page().clear()
+
 
+# Columns the list and detail views read. The denormalized children array is left out:
+# the parent FK already describes the forest, and the array grows with every remix.
+LIST_FIELDS = "id,message,author,timestamp,motif"
+BROWSE_PAGE_SIZE = 50  # whispers per browse page
+REMIX_FIELDS = "id,message,motif,author,timestamp"  # a whisper or remix on the detail page
+# Newest remixes shown on a detail page. Remix lookups filter on parent and the
+# browse list sorts on timestamp, so the table wants (run once in the SQL editor):
+#   create index concurrently if not exists whispers_parent_idx on whispers (parent);
+#   create index concurrently if not exists whispers_timestamp_idx on whispers (timestamp desc);
+REMIX_LIMIT = 50
 
-def supabase_get_all():
-    r = requests.get(TABLE_URL + "?select=*", headers=HEADERS)
+
+class SupabaseReadError(Exception):
+    pass
+
+
+def _get(url):
+    # timeouts and dropped connections become read errors, like a bad status
+    try:
+        return SESSION.get(url, timeout=REQUEST_TIMEOUT)
+    except requests.RequestException as e:
+        raise SupabaseReadError(f"Supabase is unreachable: {e}")
+
+
+# The cached fetchers raise instead of returning an empty result, so a failed
+# read is never cached for the TTL; the wrappers below turn it into st.error.
+def _request_page(fields, limit, offset):
+    r = _get(f"{TABLE_URL}?select={fields}&order=timestamp.desc&limit={limit}&offset={offset}")
     if r.status_code != 200:
-        st.error("Supabase read error.")
-        return []
+        raise SupabaseReadError("Supabase read error.")
     try:
-        data = r.json()
+        return _loads(r)
     except Exception:
-        st.error(f"Supabase get_all JSON decode error: {r.text}")
+        raise SupabaseReadError(f"Supabase get_all JSON decode error: {r.text}")
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _fetch_page(fields, limit, offset):
+    return _request_page(fields, limit, offset)
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _fetch_by_id(wid):
+    r = _get(f"{TABLE_URL}?id=eq.{wid}&select={REMIX_FIELDS}")
+    if r.status_code != 200:
+        raise SupabaseReadError("Supabase get_by_id error.")
+    try:
+        items = _loads(r)
+    except Exception:
+        raise SupabaseReadError(f"Supabase get_by_id JSON decode error: {r.text}")
+    return items[0] if items else None
+
+
+def supabase_get_all(fields=LIST_FIELDS, limit=BROWSE_PAGE_SIZE, offset=0):
+    """Newest-first whispers, projected to `fields`: `limit` rows starting at `offset`."""
+    if (fields, limit, offset) == LANDING_PAGE:
+        rows = _landing_page().get()
+        if rows is not None:
+            return rows
+    try:
+        return _fetch_page(fields, limit, offset)
+    except SupabaseReadError as e:
+        st.error(str(e))
         return []
-    for w in data:
-        if w.get("children") is None:
-            w["children"] = []
-    return data
 
 
 def supabase_get_by_id(wid):
-    r = requests.get(f"{TABLE_URL}?id=eq.{wid}", headers=HEADERS)
-    if r.status_code != 200:
-        st.error("Supabase get_by_id error.")
+    try:
+        return _fetch_by_id(wid)
+    except SupabaseReadError as e:
+        st.error(str(e))
         return None
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _fetch_with_remixes(wid):
+    r = _get(f"{TABLE_URL}?id=eq.{wid}&select={REMIX_FIELDS},remixes:whispers!parent({REMIX_FIELDS})&remixes.order=timestamp.desc&remixes.limit={REMIX_LIMIT}")
+    if r.status_code != 200:
+        # embedding needs the parent FK to be declared; fall back to two plain reads
+        w = _fetch_by_id(wid)
+        if w:
+            w = dict(w, remixes=_fetch_children(wid))
+        return w
     try:
-        items = r.json()
+        items = _loads(r)
     except Exception:
-        st.error(f"Supabase get_by_id JSON decode error: {r.text}")
-        return None
+        raise SupabaseReadError(f"Supabase get_with_remixes JSON decode error: {r.text}")
     if not items:
         return None
     w = items[0]
-    if w.get("children") is None:
-        w["children"] = []
+    w["remixes"] = w.get("remixes") or []
     return w
 
 
+def _fetch_children(wid):
+    r = _get(f"{TABLE_URL}?parent=eq.{wid}&select={REMIX_FIELDS}&order=timestamp.desc&limit={REMIX_LIMIT}")
+    if r.status_code != 200:
+        raise SupabaseReadError("Supabase get_children error.")
+    try:
+        return _loads(r)
+    except Exception:
+        raise SupabaseReadError(f"Supabase get_children JSON decode error: {r.text}")
+
+
+def supabase_get_with_remixes(wid):
+    """
+    Whisper plus its direct remixes under "remixes", in one request.
+    Remixes are found through the parent foreign key, so the parent row
+    never has to be patched when a remix is created.
+    """
+    try:
+        return _fetch_with_remixes(wid)
+    except SupabaseReadError as e:
+        st.error(str(e))
+        return None
+
+
+def supabase_get_children(wid):
+    try:
+        return _fetch_children(wid)
+    except SupabaseReadError as e:
+        st.error(str(e))
+        return []
+
+
+EDGE_PAGE_SIZE = 1000  # Supabase caps a single response at 1000 rows by default
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _fetch_edges():
+    rows = []
+    while True:
+        r = _get(f"{TABLE_URL}?select=id,message,parent&order=id&limit={EDGE_PAGE_SIZE}&offset={len(rows)}")
+        if r.status_code != 200:
+            raise SupabaseReadError("Supabase read error.")
+        try:
+            page = _loads(r)
+        except Exception:
+            raise SupabaseReadError(f"Supabase get_edges JSON decode error: {r.text}")
+        rows.extend(page)
+        if len(page) < EDGE_PAGE_SIZE:
+            return rows
+
+
+def supabase_get_edges():
+    """
+    Just what the tree needs (id, message, parent) for every whisper, pulled
+    in fixed-size pages so a large corpus neither arrives as one huge payload
+    nor gets silently cut off at the server's row cap.
+    """
+    try:
+        return _fetch_edges()
+    except SupabaseReadError as e:
+        st.error(str(e))
+        return []
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _fetch_lineage(root_id):
+    r = _get(f"{SUPABASE_URL}/rest/v1/rpc/lineage?root={root_id}&select=id,message,parent")
+    if 400 <= r.status_code < 500:
+        return None  # function not installed (or a different signature): stable, fine to cache
+    if r.status_code != 200:
+        raise SupabaseReadError("Supabase lineage error.")
+    try:
+        return _loads(r)
+    except Exception:
+        raise SupabaseReadError(f"Supabase lineage JSON decode error: {r.text}")
+
+
+def supabase_get_lineage(root_id):
+    """
+    Edge rows for `root_id` and all of its descendants, walked server-side by
+    the optional `lineage` function:
+
+        create or replace function lineage(root uuid) returns setof whispers
+        language sql stable as $$
+          with recursive t as (
+            select * from whispers where id = root
+            union all
+            select w.* from whispers w join t on w.parent = t.id
+          )
+          select * from t;
+        $$;
+
+    Returns None when the function isn't installed or the call fails, so
+    callers can fall back to the full edge list.
+    """
+    try:
+        return _fetch_lineage(root_id)
+    except SupabaseReadError:
+        return None
+
+
+PREFETCH_INTERVAL = 20  # seconds between refreshes of the first browse page
+PREFETCH_IDLE_AFTER = 300  # stop refreshing once nobody has read the page for this long
+LANDING_PAGE = (LIST_FIELDS, BROWSE_PAGE_SIZE + 1, 0)  # what view_browse asks for on page 0
+
+
+class LandingPage:
+    """
+    The prefetched first browse page, shared by every session. It is kept
+    apart from the _fetch_page cache, so refreshing it never evicts the
+    cached deeper pages and there is no window where the entry is missing.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = None
+        self._fetched_at = 0.0
+        self._generation = 0  # bumped by clear(), so a refresh in flight can't store stale rows
+        self.last_read = None  # no refreshes until someone first reads the landing page
+
+    def get(self):
+        self.last_read = time.monotonic()
+        with self._lock:
+            if self._rows is None or time.monotonic() - self._fetched_at > 2 * PREFETCH_INTERVAL:
+                return None
+            return [dict(row) for row in self._rows]
+
+    def idle(self):
+        return self.last_read is None or time.monotonic() - self.last_read > PREFETCH_IDLE_AFTER
+
+    def refresh(self):
+        with self._lock:
+            generation = self._generation
+        rows = _request_page(*LANDING_PAGE)
+        with self._lock:
+            if generation == self._generation:
+                self._rows, self._fetched_at = rows, time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._rows = None
+            self._generation += 1
+
+
+@st.cache_resource
+def _landing_page():
+    return LandingPage()
+
+
+@st.cache_resource
+def start_prefetcher():
+    """
+    One daemon thread per server process that refreshes the first browse
+    page on a timer, so the visitor who arrives after a TTL expiry gets a
+    hit instead of waiting on Supabase. It uses the shared session, and it
+    pauses while nobody is reading the page.
+    """
+    landing = _landing_page()
+
+    def loop():
+        while True:
+            if not landing.idle():
+                try:
+                    landing.refresh()
+                except Exception:
+                    pass  # a failed refresh just leaves the next visitor to fetch
+            time.sleep(PREFETCH_INTERVAL)
+
+    thread = threading.Thread(target=loop, name="whispers-prefetch", daemon=True)
+    thread.start()
+    return thread
+
+
+start_prefetcher()
+
+
 # =========================================================
-# Routing (kept experimental for Streamlit Cloud)
+# Routing
 # =========================================================
-params = st.experimental_get_query_params()
-current_view = params.get("view", ["home"])[0]
-current_id = params.get("id", [None])[0]
+current_view = st.query_params.get("view", "home")
+current_id = st.query_params.get("id")
+current_root = st.query_params.get("root")  # tree view: focus on this whisper's neighbourhood
+
+
+def navigate(view):
+    # sidebar clicks on the page already showing do nothing, instead of paying for a rerun
+    if current_view != view:
+        st.query_params.from_dict({"view": view})
+        st.rerun()
 
 
 # =========================================================
@@ -170,11 +496,11 @@ st.caption("Create whispers, remix with friends, and watch ideas evolve.")
 # =========================================================
 st.sidebar.markdown("### Navigation")
 if st.sidebar.button("Home"):
-    st.experimental_set_query_params(view="home")
+    navigate("home")
 if st.sidebar.button("All whispers"):
-    st.experimental_set_query_params(view="browse")
+    navigate("browse")
 if st.sidebar.button("Tree view"):
-    st.experimental_set_query_params(view="tree")
+    navigate("tree")
 
 
 # =========================================================
@@ -204,7 +530,6 @@ def render_home():
                 "phrase": phrase,
                 "author": author,
                 "parent": None,
-                "children": [],
                 "timestamp": now_iso(),
             }
             created = supabase_create_whisper(whisper)
@@ -213,7 +538,7 @@ def render_home():
                 snippet = make_snippet(combined_message, wid, motif)
                 st.write("Copy-ready snippet (share this on social platforms):")
                 st.code(snippet, language="text")
-                st.experimental_set_query_params(view="detail", id=wid)
+                st.query_params.from_dict({"view": "detail", "id": wid})
 
     st.markdown("---")
 
@@ -257,7 +582,7 @@ This phrasing invites others to *add their voice* and makes the action clear.
 # Detail / Remix View
 # =========================================================
 def view_detail(wid):
-    w = supabase_get_by_id(wid)
+    w = supabase_get_with_remixes(wid)
     if not w:
         st.error("Whisper not found.")
         return
@@ -290,21 +615,20 @@ def view_detail(wid):
             "phrase": remix_phrase,
             "author": remix_author,
             "parent": w.get("id"),
-            "children": [],
             "timestamp": now_iso(),
         }
         created = supabase_create_whisper(new_data)
         if created:
-            supabase_update_children(w.get("id"), child_id)
             st.success("Remix created!")
             snippet = make_snippet(new_message, child_id, w.get("motif"))
             st.code(snippet, language="text")
-            st.experimental_set_query_params(view="detail", id=child_id)
+            st.query_params.from_dict({"view": "detail", "id": child_id})
 
     # Display children
     st.write("### Existing Remixes")
-    for cid in w.get("children", []):
-        child = supabase_get_by_id(cid)
+    if len(w.get("remixes", [])) >= REMIX_LIMIT:
+        st.caption(f"Showing the {REMIX_LIMIT} most recent remixes.")
+    for child in w.get("remixes", []):
         if child:
             st.markdown(f"- {child.get('message')}")
             st.caption(f"By {child.get('author') or 'Anonymous'} • {child.get('timestamp')}")
@@ -316,36 +640,212 @@ def view_detail(wid):
 # =========================================================
 def view_browse():
     st.subheader("All Whispers")
-    all_w = supabase_get_all()
-    if not all_w:
+    try:
+        page = max(0, int(st.query_params.get("page", 0)))
+    except ValueError:
+        page = 0
+    # one extra row tells us whether there is a next page
+    rows = supabase_get_all(limit=BROWSE_PAGE_SIZE + 1, offset=page * BROWSE_PAGE_SIZE)  # newest first
+    has_next = len(rows) > BROWSE_PAGE_SIZE
+    rows = rows[:BROWSE_PAGE_SIZE]
+    if not rows:
         st.info("No whispers found.")
         return
-    for w in sorted(all_w, key=lambda x: x["timestamp"], reverse=True):
-        st.markdown(f"**{w.get('message')}**")
-        st.caption(f"By {w.get('author') or 'Anonymous'}")
-        st.code(make_snippet(w.get("message"), w.get("id"), w.get("motif")), language="text")
+    # one table widget instead of three widgets per whisper
+    df = pd.DataFrame([
+        {
+            "motif": w.get("motif") or "",
+            "message": w.get("message"),
+            "author": w.get("author") or "Anonymous",
+            "timestamp": w.get("timestamp"),
+            "link": make_link_for_id(BASE_URL, w["id"]),
+        }
+        for w in rows
+    ])
+    event = st.dataframe(
+        df,
+        hide_index=True,
+        use_container_width=True,
+        column_config={"link": st.column_config.LinkColumn("Link")},
+        on_select="rerun",
+        selection_mode="single-row",
+        key=f"browse_table_{page}",
+    )
+    st.caption(f"Page {page + 1}. Select a row to open that whisper.")
+    prev_col, next_col = st.columns(2)
+    if page > 0 and prev_col.button("← Newer"):
+        st.query_params.from_dict({"view": "browse", "page": str(page - 1)})
+        st.rerun()
+    if has_next and next_col.button("Older →"):
+        st.query_params.from_dict({"view": "browse", "page": str(page + 1)})
+        st.rerun()
+    if event.selection.rows:
+        st.query_params.from_dict({"view": "detail", "id": rows[event.selection.rows[0]]["id"]})
+        st.rerun()
 
 
 # =========================================================
 # Tree View
 # =========================================================
-def view_tree():
+def _dot_layout(G, use_pydot=False):
+    # Graphviz "dot" lays out hierarchies directly; nx_agraph (pygraphviz) is
+    # several times faster than the nx_pydot route, so pydot is only a fallback.
+    try:
+        if use_pydot:
+            from networkx.drawing.nx_pydot import pydot_layout
+            return pydot_layout(G, prog="dot")
+        from networkx.drawing.nx_agraph import graphviz_layout
+        return graphviz_layout(G, prog="dot")
+    except (ImportError, OSError, ValueError):
+        # binding not installed, or the graphviz binaries aren't on PATH
+        return None
+
+
+@st.cache_data(show_spinner=False)
+def tree_layout(nodes, edges):
+    """
+    Node positions for the lineage forest, using the first tree-aware layout
+    available: graphviz dot (pygraphviz), igraph Reingold-Tilford, dot via
+    pydot. spring_layout is the last resort. Cached on the topology, so
+    reruns that don't change the graph skip the layout entirely.
+    """
+    import networkx as nx
+
+    G = nx.DiGraph()
+    G.add_nodes_from(nodes)
+    G.add_edges_from(edges)
+    pos = _dot_layout(G)
+    if pos is not None:
+        return pos
+    if ig is None:
+        return _dot_layout(G, use_pydot=True) or nx.spring_layout(G, seed=42)
+    nodes = list(G.nodes)
+    idx = {n: i for i, n in enumerate(nodes)}
+    g = ig.Graph(n=len(nodes), edges=[(idx[u], idx[v]) for u, v in G.edges], directed=True)
+    roots = [idx[n] for n in nodes if G.in_degree(n) == 0]
+    layout = g.layout_reingold_tilford(mode="out", root=roots)
+    # igraph's y grows downward; flip it so roots sit at the top
+    return {n: (x, -y) for n, (x, y) in zip(nodes, layout.coords)}
+
+
+def tree_html(G, labels, pos, physics=False):
+    """
+    vis.js canvas for the tree. With physics off, nodes are pinned to the
+    precomputed layout (scaled into roughly 1000x600px, y flipped for screen
+    coordinates) so the browser renders without simulating forces.
+    """
+    net = Network(height="600px", width="100%", directed=True)
+    xs = [p[0] for p in pos.values()]
+    ys = [p[1] for p in pos.values()]
+    sx = 1000 / ((max(xs) - min(xs)) or 1)
+    sy = 600 / ((max(ys) - min(ys)) or 1)
+    for n in G.nodes:
+        x, y = pos[n]
+        net.add_node(n, label=labels[n], title=G.nodes[n].get("label") or "", x=x * sx, y=-y * sy)
+    for u, v in G.edges:
+        net.add_edge(u, v)
+    net.toggle_physics(physics)
+    return net.generate_html()
+
+
+MAX_TREE_NODES = 300     # draw budget for the tree view
+MAX_LABELED_NODES = 100  # above this, only well-connected nodes get labels
+MAX_PNG_LABELED_NODES = 150  # the matplotlib fallback drops labels entirely past this
+
+
+def budget_tree(G, root_id=None):
+    """
+    Cap the number of drawn nodes. With a root_id, show its neighbourhood
+    (three hops either way); otherwise the top of every lineage, breadth-first.
+    """
+    import networkx as nx
+
+    if len(G) <= MAX_TREE_NODES:
+        return G
+    if root_id in G:
+        return nx.ego_graph(G, root_id, radius=3, undirected=True)
+    keep = []
+    queue = deque(n for n in G if G.in_degree(n) == 0)
+    while queue and len(keep) < MAX_TREE_NODES:
+        n = queue.popleft()
+        keep.append(n)
+        queue.extend(G.successors(n))
+    return G.subgraph(keep)
+
+
+def view_tree(root_id=None):
+    # networkx/matplotlib are only needed here; importing them lazily keeps
+    # them off the cold start of the home, detail and browse views
+    import networkx as nx
+
     st.subheader("Whisper Lineage Tree")
-    all_w = supabase_get_all()
+    all_w = supabase_get_lineage(root_id) if root_id else None
+    if root_id and all_w == []:
+        st.warning("Whisper not found; showing the full tree instead.")
+        all_w = None
+    if all_w is None:
+        all_w = supabase_get_edges()
     if not all_w:
         st.info("No whispers yet.")
         return
+    # one frame for the whole edge list; nodes and edges go into the graph in bulk
+    df = pd.DataFrame(all_w, columns=["id", "message", "parent"])
+    G = nx.DiGraph()
+    G.add_nodes_from((wid, {"label": msg}) for wid, msg in zip(df["id"], df["message"]))
+    # only edges between returned rows: a lineage's root still names its own parent,
+    # which would otherwise come in as a phantom node outside the lineage
+    G.add_edges_from(df.loc[df["parent"].isin(df["id"]), ["parent", "id"]].itertuples(index=False, name=None))
+    total = len(G)
+    G = budget_tree(G, root_id)
+    if len(G) < total:
+        st.caption(f"Showing {len(G)} of {total} whispers. Add `&root=<id>` to the URL to focus on one lineage.")
+    edges = tuple(G.edges)
+    pos = tree_layout(tuple(G.nodes), edges)
+    labels = tree_labels(tuple(G.nodes(data="label")), edges)
+    if Network is not None:
+        physics = st.toggle("Physics", value=False, help="Let the browser rearrange nodes with a force simulation.")
+        components.html(tree_html(G, labels, pos, physics), height=620)
+        return
+    st.image(tree_png(tuple(G.edges), tuple(labels.items()), pos))
+
+
+@st.cache_data(show_spinner=False)
+def tree_labels(node_messages, edges):
+    """
+    Truncated display labels, cached like the layout. Past MAX_LABELED_NODES
+    only nodes with above-median degree keep theirs.
+    """
+    labels = {n: (msg or "")[:40] for n, msg in node_messages}
+    if len(labels) > MAX_LABELED_NODES:
+        degrees = dict.fromkeys(labels, 0)
+        for u, v in edges:
+            degrees[u] += 1
+            degrees[v] += 1
+        cutoff = statistics.median(degrees.values())
+        labels = {n: (label if degrees[n] > cutoff else "") for n, label in labels.items()}
+    return labels
+
+
+@st.cache_data(show_spinner=False)
+def tree_png(edges, labels, pos):
+    # rasterized once per (graph, labels, layout); reruns just resend the bytes
+    import io
+    import networkx as nx
+    from matplotlib.figure import Figure  # no pyplot: no global figure registry, no GUI backend
+
     G = nx.DiGraph()
-    for w in all_w:
-        G.add_node(w.get("id"), label=w.get("message"))
-        for c in w.get("children", []):
-            G.add_edge(w.get("id"), c)
-    fig = plt.figure(figsize=(12, 8))
-    pos = nx.spring_layout(G, seed=42)
-    nx.draw(G, pos, with_labels=False, node_size=900, node_color="lightblue", edge_color="gray", arrows=True)
-    labels = {n: G.nodes[n].get("label", "")[:40] for n in G.nodes}
-    nx.draw_networkx_labels(G, pos, labels, font_size=7)
-    st.pyplot(fig)
+    G.add_nodes_from(n for n, _ in labels)
+    G.add_edges_from(edges)
+    n = len(G)
+    # big graphs: smaller nodes, coarser raster, and no text layout at all
+    fig = Figure(figsize=(12, 8), dpi=72 if n < 200 else 48)
+    ax = fig.add_subplot()
+    nx.draw(G, pos, ax=ax, with_labels=False, node_size=max(50, 900 - n), node_color="lightblue", edge_color="gray", arrows=True)
+    if n <= MAX_PNG_LABELED_NODES:
+        nx.draw_networkx_labels(G, pos, dict(labels), ax=ax, font_size=7)
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight")
+    return buf.getvalue()
 
 
 # =========================================================
@@ -356,7 +856,7 @@ if current_view == "detail" and current_id:
 elif current_view == "browse":
     view_browse()
 elif current_view == "tree":
-    view_tree()
+    view_tree(current_root)
 else:
     # show home with instructions
     render_home()
@@ -1,16 +1,30 @@
 #!/usr/bin/env python3
 import streamlit as st
-import json
 from datetime import datetime
 import os
-import base64
-import re
+import tempfile
+import hashlib
+import unicodedata
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib codec
+    orjson = None
+    import json
+
+try:
+    import pybase64 as b64codec  # optional: SIMD-accelerated base64
+except ImportError:
+    import base64 as b64codec
 
 # ----------------------------
 # Config / file paths
 # ----------------------------
-TRAIL_FILE = "whisper_trail.json"
+TRAIL_FILE = "whisper_trail.jsonl"  # one whisper per line, oldest first; appended on post
+LEGACY_TRAIL_FILE = "whisper_trail.json"
 MOTIF_FILE = "motif_library.json"
+MOTIF_IMAGE_DIR = "motif_images"  # raw image files; the JSON only keeps their paths
+META_KEY = "__meta__"  # bookkeeping entry in the motif library, not a motif
 
 # ----------------------------
 # Utility: safe load & save
@@ -18,6 +32,9 @@ MOTIF_FILE = "motif_library.json"
 def safe_load(path, fallback):
     if os.path.exists(path):
         try:
+            if orjson is not None:
+                with open(path, "rb") as f:
+                    return orjson.loads(f.read())
             with open(path, "r", encoding="utf-8") as f:
                 return json.load(f)
         except Exception:
@@ -25,66 +42,167 @@ def safe_load(path, fallback):
     return fallback
 
 def safe_save(path, data):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    if orjson is not None:
+        payload = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    else:
+        payload = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    write_atomic(path, payload)
+
+def write_atomic(path, payload):
+    # Write a temp file and swap it in, so a crash mid-write never truncates the file.
+    # The temp name is unique per call, so concurrent saves can't interleave into one file.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def dump_line(rec):
+    return orjson.dumps(rec) if orjson is not None else json.dumps(rec, ensure_ascii=False).encode("utf-8")
+
+# ----------------------------
+# Trail storage: append-only JSON Lines
+# ----------------------------
+def load_trail():
+    # oldest first in memory, same as the file; the UI renders it reversed
+    if not os.path.exists(TRAIL_FILE):
+        legacy = safe_load(LEGACY_TRAIL_FILE, [])
+        return legacy[::-1] if isinstance(legacy, list) else []  # the old JSON list was newest first
+    trail_list = []
+    with open(TRAIL_FILE, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                trail_list.append(orjson.loads(line) if orjson is not None else json.loads(line))
+            except ValueError:
+                continue  # torn last line from an interrupted append
+    return trail_list
+
+def append_trail(whisper):
+    # O(1) per post instead of re-serializing the whole trail
+    with open(TRAIL_FILE, "ab") as f:
+        f.write(dump_line(whisper) + b"\n")
+
+def save_trail(trail_list):
+    # full rewrite; only for repairs and motif deletes
+    write_atomic(TRAIL_FILE, b"".join(dump_line(w) + b"\n" for w in trail_list))
 
 # ----------------------------
 # Load existing data
 # ----------------------------
-trail = safe_load(TRAIL_FILE, [])
+trail = load_trail()
 motif_dict = safe_load(MOTIF_FILE, {
-    "🫧": {"meaning": "fragile truth", "image": None, "format": None},
-    "🌱": {"meaning": "growth", "image": None, "format": None},
-    "🔥": {"meaning": "urgency", "image": None, "format": None},
-    "🧬": {"meaning": "identity", "image": None, "format": None},
-    "✨": {"meaning": "hope", "image": None, "format": None},
-    "💡": {"meaning": "insight", "image": None, "format": None}, 
-    "🪡": {"meaning": "reply", "image": None, "format": None},
-    "🧵": {"meaning": "thread", "image": None, "format": None}
+    "🫧": {"meaning": "fragile truth", "image_path": None, "format": None},
+    "🌱": {"meaning": "growth", "image_path": None, "format": None},
+    "🔥": {"meaning": "urgency", "image_path": None, "format": None},
+    "🧬": {"meaning": "identity", "image_path": None, "format": None},
+    "✨": {"meaning": "hope", "image_path": None, "format": None},
+    "💡": {"meaning": "insight", "image_path": None, "format": None}, 
+    "🪡": {"meaning": "reply", "image_path": None, "format": None},
+    "🧵": {"meaning": "thread", "image_path": None, "format": None}
 })
 
 # ----------------------------
-# Helpers: base64 encoding
+# Helpers: motif tags
+# ----------------------------
+def norm_tag(tag):
+    # NFKC folds look-alike sequences (compatibility forms, ligatures) into one motif
+    return unicodedata.normalize("NFKC", tag)
+
+def valid_tag(tag):
+    return (len(tag) == 1 or tag.isprintable()) and tag != META_KEY
+
+# ----------------------------
+# Helpers: motif image files
 # ----------------------------
-def encode_file_to_base64(file):
+def read_upload(file):
     if file is None:
         return None
-    try:
-        file.seek(0)
-    except Exception:
-        pass
-    data = file.read()
+    if hasattr(file, "getvalue"):
+        # UploadedFile is a BytesIO: hand back its buffer, no seek/read copy
+        data = file.getvalue()
+    else:
+        try:
+            file.seek(0)
+        except Exception:
+            pass
+        data = file.read()
     if isinstance(data, str):
         data = data.encode("utf-8")
-    return base64.b64encode(data).decode("utf-8")
+    return data
+
+def save_motif_image(data, fmt):
+    # content-addressed, so re-uploading the same picture reuses one file
+    os.makedirs(MOTIF_IMAGE_DIR, exist_ok=True)
+    name = f"{hashlib.sha1(data).hexdigest()[:16]}.{fmt or 'bin'}"
+    path = os.path.join(MOTIF_IMAGE_DIR, name)
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(data)
+    return path
 
 def decode_b64_to_bytes(b64str):
     if not b64str:
         return None
-    return base64.b64decode(b64str)
+    return b64codec.b64decode(b64str)
+
+def migrate_legacy_image(b64str, fmt):
+    # legacy base64 blob -> sidecar file path, or None if it can't be decoded or written.
+    # Callers keep the blob on None, so a full disk or read-only mount loses nothing.
+    try:
+        return save_motif_image(decode_b64_to_bytes(b64str), fmt)
+    except (ValueError, TypeError, OSError):  # binascii.Error is a ValueError
+        return None
+
+def has_image(data):
+    return bool(data.get("image_path")) and os.path.exists(data["image_path"])
 
 # ----------------------------
 # Auto-repair / normalize motif dict and trail
 # ----------------------------
 def normalize_motifs(m_dict):
     repaired = {}
+    changed = False
     for k, v in m_dict.items():
+        if k == META_KEY:
+            repaired[k] = v if isinstance(v, dict) else {}
+            changed = changed or repaired[k] is not v
+            continue
         if isinstance(v, str):
-            repaired[k] = {"meaning": v, "image": None, "format": None}
+            repaired[k] = {"meaning": v, "image_path": None, "format": None}
+            changed = True
             continue
         if isinstance(v, dict):
+            image_path = v.get("image_path")
+            if not image_path and v.get("image"):
+                # legacy base64 blob: decode once into a sidecar file
+                image_path = migrate_legacy_image(v["image"], v.get("format"))
+                if image_path is None:
+                    # keep the blob as-is (not rendered) and retry on a later load
+                    repaired[k] = dict(v, image_path=None)
+                    continue
             repaired[k] = {
                 "meaning": v.get("meaning", "custom"),
-                "image": v.get("image"),
+                "image_path": image_path,
                 "format": v.get("format")
             }
+            changed = changed or repaired[k] != v
             continue
-        repaired[k] = {"meaning": "custom", "image": None, "format": None}
-    return repaired
+        repaired[k] = {"meaning": "custom", "image_path": None, "format": None}
+        changed = True
+    return repaired, changed
 
 def normalize_trail(trail_list, motifs):
     repaired = []
     changed = False
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # default for undated whispers, formatted once
     for w in trail_list:
         if not isinstance(w, dict):
             continue
@@ -93,7 +211,7 @@ def normalize_trail(trail_list, motifs):
             "message": w.get("message", ""),
             "link": w.get("link", ""),
             "author": w.get("author", "Anonymous"),
-            "timestamp": w.get("timestamp", datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+            "timestamp": w.get("timestamp", now),
             "remix": w.get("remix", "Original"),
             "image": w.get("image"),
             "image_format": w.get("image_format"),
@@ -101,14 +219,18 @@ def normalize_trail(trail_list, motifs):
         }
 
         if fixed["motif"] not in motifs:
-            motifs[fixed["motif"]] = {"meaning": "restored-motif", "image": None, "format": None}
+            motifs[fixed["motif"]] = {"meaning": "restored-motif", "image_path": None, "format": None}
             changed = True
 
+        image_path = None
         if fixed.get("image") and not fixed.get("image_motif"):
+            image_path = migrate_legacy_image(fixed["image"], fixed.get("image_format"))
+        # the whisper keeps its blob until the sidecar file is written
+        if image_path:
             tag = generate_image_motif_tag(motifs)
             motifs[tag] = {
                 "meaning": "migrated-image",
-                "image": fixed["image"],
+                "image_path": image_path,
                 "format": fixed.get("image_format")
             }
             fixed["image_motif"] = tag
@@ -126,6 +248,16 @@ def normalize_trail(trail_list, motifs):
 def generate_image_motif_tag(m_dict, base="📷"):
     if base not in m_dict:
         return base
+    meta = m_dict.setdefault(META_KEY, {})
+    if "image_counter" not in meta:
+        # libraries saved before the counter existed: seed it with one scan
+        meta["image_counter"] = highest_image_suffix(m_dict, base)
+    meta["image_counter"] += 1
+    while f"{base}{meta['image_counter']}" in m_dict:  # a hand-made tag took this number
+        meta["image_counter"] += 1
+    return f"{base}{meta['image_counter']}"
+
+def highest_image_suffix(m_dict, base):
     highest = 1
     for k in m_dict:
         if k == base:
@@ -138,39 +270,51 @@ def generate_image_motif_tag(m_dict, base="📷"):
                     highest = max(highest, n)
                 except:
                     pass
-    return f"{base}{highest+1}"
+    return highest
 
 # ----------------------------
 # Normalize on load
 # ----------------------------
-motif_dict = normalize_motifs(motif_dict)
+motif_dict, motifs_changed = normalize_motifs(motif_dict)
 trail, motif_dict, trail_changed = normalize_trail(trail, motif_dict)
-safe_save(MOTIF_FILE, motif_dict)
-if trail_changed:
-    safe_save(TRAIL_FILE, trail)
+# reruns happen on every widget event; only rewrite the library when it needed repair
+if motifs_changed or trail_changed or not os.path.exists(MOTIF_FILE):
+    safe_save(MOTIF_FILE, motif_dict)
+if trail_changed or not os.path.exists(TRAIL_FILE):
+    save_trail(trail)
 
 # ----------------------------
 # Unicode / Fancy Text Designer (for motif only)
 # ----------------------------
-FONT_STYLES = {
-    "Default": str,
-    "Bold": lambda s: ''.join(chr(ord(c)+0x1D400-ord('A')) if 'A'<=c<='Z' else
-                                chr(ord(c)+0x1D41A-ord('a')) if 'a'<=c<='z' else c
-                                for c in s),
-    "Italic": lambda s: ''.join(chr(ord(c)+0x1D434-ord('A')) if 'A'<=c<='Z' else
-                                chr(ord(c)+0x1D44E-ord('a')) if 'a'<=c<='z' else c
-                                for c in s),
-    "Bold Italic": lambda s: ''.join(chr(ord(c)+0x1D468-ord('A')) if 'A'<=c<='Z' else
-                                     chr(ord(c)+0x1D482-ord('a')) if 'a'<=c<='z' else c
-                                     for c in s),
-    "Script": lambda s: ''.join(chr(ord(c)+0x1D49C-ord('A')) if 'A'<=c<='Z' else
-                               chr(ord(c)+0x1D4B6-ord('a')) if 'a'<=c<='z' else c
-                               for c in s),
-    "Fraktur": lambda s: ''.join(chr(ord(c)+0x1D504-ord('A')) if 'A'<=c<='Z' else
-                                chr(ord(c)+0x1D51E-ord('a')) if 'a'<=c<='z' else c
-                                for c in s),
+def font_table(upper_start, lower_start):
+    # A-Z / a-z -> the matching Mathematical Alphanumeric block, for str.translate
+    table = {ord('A') + i: upper_start + i for i in range(26)}
+    table.update({ord('a') + i: lower_start + i for i in range(26)})
+    return table
+
+FONT_TABLES = {
+    "Bold": font_table(0x1D400, 0x1D41A),
+    "Italic": font_table(0x1D434, 0x1D44E),
+    "Bold Italic": font_table(0x1D468, 0x1D482),
+    "Script": font_table(0x1D49C, 0x1D4B6),
+    "Fraktur": font_table(0x1D504, 0x1D51E),
 }
 
+FONT_STYLES = {"Default": str}
+FONT_STYLES.update({name: (lambda s, t=table: s.translate(t)) for name, table in FONT_TABLES.items()})
+
+@st.cache_data(max_entries=16)  # one entry per library state; old states are evicted
+def build_motif_options(motif_items):
+    # motif_items: ((tag, has_image_path, meaning), ...); returns labels and label -> tag
+    labels = []
+    label_to_tag = {}
+    for key, with_image, meaning in motif_items:
+        suffix = " 🖼️" if with_image else ""
+        label = f"{key}{suffix} — {meaning}"
+        labels.append(label)
+        label_to_tag[label] = key
+    return labels, label_to_tag
+
 # ----------------------------
 # Sidebar: Motif Manager
 # ----------------------------
@@ -183,14 +327,14 @@ if st.sidebar.button("Save motif", key="save_motif"):
     if not new_key:
         st.sidebar.error("Please provide a motif tag (emoji or short text).")
     else:
-        if len(new_key)==1 or new_key.isprintable():
-            image_b64 = None
+        new_key = norm_tag(new_key)
+        if valid_tag(new_key):
+            image_path = None
             fmt = None
             if new_upload:
-                new_upload.seek(0)
-                image_b64 = encode_file_to_base64(new_upload)
                 fmt = (new_upload.type.split("/")[-1]) if hasattr(new_upload,"type") else None
-            motif_dict[new_key] = {"meaning": new_meaning or "custom", "image": image_b64, "format": fmt}
+                image_path = save_motif_image(read_upload(new_upload), fmt)
+            motif_dict[new_key] = {"meaning": new_meaning or "custom", "image_path": image_path, "format": fmt}
             safe_save(MOTIF_FILE, motif_dict)
             st.sidebar.success(f"Motif '{new_key}' saved.")
         else:
@@ -198,28 +342,28 @@ if st.sidebar.button("Save motif", key="save_motif"):
 
 st.sidebar.markdown("---")
 st.sidebar.subheader("Existing motifs")
-keys = list(motif_dict.keys())
+keys = [k for k in motif_dict if k != META_KEY]
 for k in keys:
     v = motif_dict[k]
     col1, col2 = st.sidebar.columns([0.2,0.8])
     with col1:
-        if v.get("image"):
-            try: st.image(decode_b64_to_bytes(v.get("image")), width=32)
+        if has_image(v):
+            try: st.image(v["image_path"], width=32)
             except: st.write("🖼")
         else:
             st.markdown(f"<div style='font-size:18px'>{k}</div>", unsafe_allow_html=True)
     with col2:
         st.markdown(f"**{k}** — {v.get('meaning','')}")
-        btn_key = f"del_{re.sub(r'\\W','_',str(k))}"
-        if st.button("Delete", key=btn_key):
+        # widget keys take any string, so the (unique) tag itself is the key
+        if st.button("Delete", key=f"del_{k}"):
             fallback = "🧵"
             for w in trail:
                 if w.get("motif")==k: w["motif"]=fallback
                 if w.get("image_motif")==k: w["image_motif"]=None
             motif_dict.pop(k,None)
             safe_save(MOTIF_FILE, motif_dict)
-            safe_save(TRAIL_FILE, trail)
-            st.experimental_rerun()
+            save_trail(trail)
+            st.rerun()
 
 # ----------------------------
 # Main UI - Whisper Generator
@@ -229,13 +373,12 @@ st.markdown("Create and share poetic fragments with symbolic motifs, fancy text,
 
 with st.form("whisper_form"):
     st.subheader("Compose a Whisper")
-    motif_options = []
-    for key,data in motif_dict.items():
-        suffix = " 🖼️" if data.get("image") else ""
-        meaning = data.get("meaning","custom")
-        motif_options.append(f"{key}{suffix} — {meaning}")
+    motif_options, label_to_tag = build_motif_options(tuple(
+        (key, bool(data.get("image_path")), data.get("meaning","custom"))
+        for key,data in motif_dict.items() if key != META_KEY
+    ))
     selected = st.selectbox("Choose a motif", motif_options)
-    motif_selected = selected.split()[0]
+    motif_selected = label_to_tag[selected]
     chosen_meaning = motif_dict.get(motif_selected, {}).get("meaning","custom")
     st.caption(f"Motif meaning: {chosen_meaning}")
 
@@ -253,11 +396,9 @@ if submitted and message and link:
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     image_motif_tag = None
     if uploaded_image:
-        uploaded_image.seek(0)
-        image_b64 = encode_file_to_base64(uploaded_image)
         fmt = (uploaded_image.type.split("/")[-1]) if hasattr(uploaded_image,"type") else None
         tag = generate_image_motif_tag(motif_dict)
-        motif_dict[tag] = {"meaning":"whisper-image","image":image_b64,"format":fmt}
+        motif_dict[tag] = {"meaning":"whisper-image","image_path":save_motif_image(read_upload(uploaded_image), fmt),"format":fmt}
         image_motif_tag = tag
         safe_save(MOTIF_FILE, motif_dict)
 
@@ -277,8 +418,8 @@ if submitted and message and link:
         "image_motif": image_motif_tag
     }
 
-    trail.insert(0, whisper)
-    safe_save(TRAIL_FILE, trail)
+    trail.append(whisper)
+    append_trail(whisper)
     st.success("Whisper added to the trail!")
 
     # Output formats
@@ -300,12 +441,12 @@ st.header("📚 Whisper Trail")
 if not trail:
     st.info("No whispers yet. Be the first to seed one.")
 else:
-    for idx,w in enumerate(trail):
+    for w in reversed(trail):  # newest first
         st.markdown("### Motif")
         mtag = w.get("motif","🧵")
-        mdata = motif_dict.get(mtag, {"meaning":"custom","image":None})
-        if mdata.get("image"):
-            try: st.image(decode_b64_to_bytes(mdata.get("image")), width=48)
+        mdata = motif_dict.get(mtag) or motif_dict.get(norm_tag(mtag), {"meaning":"custom","image_path":None})
+        if has_image(mdata):
+            try: st.image(mdata["image_path"], width=48)
             except: st.markdown(f"<div style='font-size:18px'>{mtag}</div>", unsafe_allow_html=True)
         else:
             st.markdown(f"<span style='font-size:1.2em'>{mtag}</span>", unsafe_allow_html=True)
@@ -321,8 +462,9 @@ else:
         if w.get("image_motif"):
             im_tag = w.get("image_motif")
             im_data = motif_dict.get(im_tag)
-            if im_data and im_data.get("image"):
-                st.image(decode_b64_to_bytes(im_data.get("image")), caption="Attached image", use_container_width=True)
+            if im_data and has_image(im_data):
+                try: st.image(im_data["image_path"], caption="Attached image", use_container_width=True)
+                except: st.caption("Attached image could not be displayed.")
             else:
                 st.caption("Attached image motif missing (it may have been deleted).")
         st.markdown("---")